@@ -8,7 +8,23 @@ from dotenv import load_dotenv
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 from deepagents import create_deep_agent
-from examples.rca.tools import list_tables_in_directory, get_schema, query_parquet_files
+from examples.rca.tools import get_analysis_playbook, list_tables_in_directory, get_schema, query_parquet_files, summarize_column
+
+def build_parser():
+    """Build the command-line parser for the RCA agent."""
+    parser = argparse.ArgumentParser(description="RCA Agent")
+    parser.add_argument("--query", type=str, help="Initial query to start the agent")
+    parser.add_argument("--output", type=str, help="Path to save the output JSON")
+    parser.add_argument(
+        "--keep-history",
+        action="store_true",
+        help="In interactive mode, send earlier turns with each new question (context grows every turn)",
+    )
+    return parser
+
+# Handle --help and invalid arguments before the API key check below
+if __name__ == "__main__":
+    build_parser().parse_args()
 
 # Load environment variables (for API keys)
 # Explicitly look for .env in the project root
@@ -22,6 +38,10 @@ if os.environ.get("ANTHROPIC_API_KEY") == "sk-ant-xxxx":
     print("Please edit the .env file and add your actual API key.")
     sys.exit(1)
 
+if not os.environ.get("ANTHROPIC_API_KEY") and not os.environ.get("OPENAI_API_KEY"):
+    print("Please set ANTHROPIC_API_KEY or OPENAI_API_KEY environment variable.")
+    sys.exit(1)
+
 
 # Define the System Prompt for the RCA Agent
 RCA_SYSTEM_PROMPT = """
@@ -33,50 +53,10 @@ You are investigating a system failure in namespace `ts0`.
 **Objective:**
 Analyze the span metrics, trace data, and logs in the current directory to identify the **Root Cause Service**.
 
-**Analysis Workflow:**
-
-Step 1: Discover and Understand Data
-- Use `list_tables_in_directory` to find available parquet files.
-- Use `get_schema` on key files (logs, traces, metrics) to understand columns.
-- *Note: Do this once. Do not repeat.*
-
-Step 2: High-Level Problem Overview
-- Query `conclusion.parquet` (if available) or summarize the general error patterns.
-- Identify the initial symptoms (e.g., which service is reporting errors?).
-
-Step 3: Analyze Anomalous Data (Focus on Abnormal Period)
-- Extract errors and high latency events specifically within the **Abnormal Period**.
-- **Query Example:**
-  ```sql
-  SELECT service_name, level, COUNT(*) as count 
-  FROM abnormal_logs 
-  WHERE time >= TIMESTAMP '2025-07-23 14:10:23' 
-    AND time <= TIMESTAMP '2025-07-23 14:14:23'
-  GROUP BY service_name, level 
-  ORDER BY count DESC 
-  LIMIT 50
-  ```
-
-Step 4: Compare with Normal Data (Focus on Normal Period)
-- Establish a baseline by querying the **Normal Period**.
-- Compare error counts and latency distributions.
-- **Query Example:**
-  ```sql
-  SELECT service_name, level, COUNT(*) as error_count 
-  FROM normal_logs 
-  WHERE level = 'ERROR' 
-    AND time >= TIMESTAMP '2025-07-23 14:06:23' 
-    AND time < TIMESTAMP '2025-07-23 14:10:23'
-  GROUP BY service_name, level 
-  ORDER BY error_count DESC 
-  LIMIT 20
-  ```
-
-Step 5: Deep Dive & Root Cause Identification
-- Drill down into the service with the highest error increase or latency spike.
-- Trace the error propagation: Is the error internal, or coming from a downstream service?
-- Use `trace_id` to correlate logs and traces if needed.
-- **Iterate your queries** until you isolate the origin of the fault.
+**Workflow:**
+Call `get_analysis_playbook` once at the start for the step-by-step analysis workflow and example queries.
+To read many parquet files as one table, pass a glob such as `dir/*.parquet` instead of listing each file.
+Compare the Abnormal Period against the Normal Period and iterate until you isolate the origin of the fault.
 
 **Final Answer Requirements:**
 You MUST provide the final answer in the following exact format:
@@ -96,26 +76,26 @@ def serialize_message(message):
     }
 
 def main():
-    parser = argparse.ArgumentParser(description="RCA Agent")
-    parser.add_argument("--query", type=str, help="Initial query to start the agent")
-    parser.add_argument("--output", type=str, help="Path to save the output JSON")
-    args = parser.parse_args()
+    args = build_parser().parse_args()
 
-    # Check for API Key
-    if not os.environ.get("ANTHROPIC_API_KEY") and not os.environ.get("OPENAI_API_KEY"):
-        print("Please set ANTHROPIC_API_KEY or OPENAI_API_KEY environment variable.")
-        return
+    # Flush each line as it is printed, even when stdout is piped to a log
+    sys.stdout.reconfigure(line_buffering=True)
 
-    # Create the Deep Agent
+    # Create the Deep Agent once; the tool module's DuckDB connection and
+    # schema/result caches then live for the whole session
     # Explicitly use OpenAI model if ANTHROPIC_API_KEY is not set
     model = None
     if not os.environ.get("ANTHROPIC_API_KEY") and os.environ.get("OPENAI_API_KEY"):
         from langchain_openai import ChatOpenAI
         model = ChatOpenAI(model="gpt-4o")
 
+    # No explicit cache_control needed: create_deep_agent installs
+    # AnthropicPromptCachingMiddleware, which marks the system prompt and tool
+    # definitions as cache breakpoints for Anthropic models and is a no-op for
+    # ChatOpenAI. Keep RCA_SYSTEM_PROMPT static so the cached prefix stays valid.
     agent = create_deep_agent(
         model=model,
-        tools=[list_tables_in_directory, get_schema, query_parquet_files],
+        tools=[get_analysis_playbook, list_tables_in_directory, get_schema, query_parquet_files, summarize_column],
         system_prompt=RCA_SYSTEM_PROMPT,
     )
 
@@ -152,7 +132,10 @@ def main():
         print("🤖 RCA Agent Initialized.")
         print("You can now ask the agent to analyze your parquet files.")
         print("Example: 'Analyze the logs in /data/logs to find why the checkout service failed around 10:00 AM.'")
-        
+
+        # Each turn starts from a fresh context unless --keep-history is set, so
+        # the tokens sent per turn do not grow with the length of the session
+        history = []
         while True:
             try:
                 user_input = input("\nUser: ")
@@ -160,7 +143,9 @@ def main():
                     break
                 
                 print("\nAgent is thinking...")
-                result = agent.invoke({"messages": [{"role": "user", "content": user_input}]})
+                result = agent.invoke({"messages": [*history, {"role": "user", "content": user_input}]})
+                if args.keep_history:
+                    history = result["messages"]
                 print(f"\nAgent: {result['messages'][-1].content}")
                 
             except KeyboardInterrupt:
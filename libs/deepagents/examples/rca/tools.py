@@ -1,48 +1,430 @@
+import glob
 import json
 import os
-from datetime import datetime
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 from typing import Union, List, Any
 
 import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 TOKEN_LIMIT = 5000
+# Texts longer than this are token-counted from a head/tail sample and extrapolated
+TOKEN_SAMPLE_THRESHOLD = 64 * 1024
+TOKEN_SAMPLE_CHARS = 8 * 1024
+# Result rows are token-counted from this many leading rows
+TOKEN_SAMPLE_ROWS = 5
+# Extrapolating from the leading rows rejects a result outright only when the
+# estimate exceeds the budget by this factor; closer calls are measured in full
+TOKEN_ESTIMATE_MARGIN = 10
+# Most frequent values reported per column in an over-budget result summary
+SUMMARY_TOP_VALUES = 5
+# Top values are truncated to this many characters, and skipped for string
+# columns holding values longer than SUMMARY_MAX_VALUE_CHARS (e.g. stack traces)
+SUMMARY_VALUE_CHARS = 80
+SUMMARY_MAX_VALUE_CHARS = 200
+
+# Step-by-step RCA workflow, served on demand by get_analysis_playbook instead
+# of being resent in the system prompt on every model call
+ANALYSIS_PLAYBOOK = """
+**Analysis Workflow:**
+
+Step 1: Discover and Understand Data
+- Use `list_tables_in_directory` to find available parquet files.
+- Use `get_schema` on key files (logs, traces, metrics) to understand columns.
+- *Note: Do this once. Do not repeat.*
+
+Step 2: High-Level Problem Overview
+- Query `conclusion.parquet` (if available) or summarize the general error patterns.
+- Identify the initial symptoms (e.g., which service is reporting errors?).
+- Use `summarize_column` for value counts (e.g., errors per service); it only reads the columns it needs.
+
+Step 3: Analyze Anomalous Data (Focus on Abnormal Period)
+- Extract errors and high latency events specifically within the **Abnormal Period**.
+- **Query Example:**
+  ```sql
+  SELECT service_name, level, COUNT(*) as count 
+  FROM abnormal_logs 
+  WHERE time >= TIMESTAMP '2025-07-23 14:10:23' 
+    AND time <= TIMESTAMP '2025-07-23 14:14:23'
+  GROUP BY service_name, level 
+  ORDER BY count DESC 
+  LIMIT 50
+  ```
+
+Step 4: Compare with Normal Data (Focus on Normal Period)
+- Establish a baseline by querying the **Normal Period**.
+- Compare error counts and latency distributions.
+- **Query Example:**
+  ```sql
+  SELECT service_name, level, COUNT(*) as error_count 
+  FROM normal_logs 
+  WHERE level = 'ERROR' 
+    AND time >= TIMESTAMP '2025-07-23 14:06:23' 
+    AND time < TIMESTAMP '2025-07-23 14:10:23'
+  GROUP BY service_name, level 
+  ORDER BY error_count DESC 
+  LIMIT 20
+  ```
+
+Step 5: Deep Dive & Root Cause Identification
+- Drill down into the service with the highest error increase or latency spike.
+- Trace the error propagation: Is the error internal, or coming from a downstream service?
+- Use `trace_id` to correlate logs and traces if needed.
+- **Iterate your queries** until you isolate the origin of the fault.
+"""
+
+# Queries we can safely wrap in an outer SELECT, and a trailing LIMIT on the outer query
+_WRAPPABLE_QUERY_RE = re.compile(r"^\s*(select|with|from|values)\b", re.IGNORECASE)
+_OUTER_LIMIT_RE = re.compile(r"\blimit\s+\d+(\s+offset\s+\d+)?\s*$", re.IGNORECASE)
+_NON_IDENTIFIER_RE = re.compile(r"[^A-Za-z0-9_]")
+# Glob wildcards ("*", "**", "?", "[...]") in a parquet path
+_GLOB_RE = re.compile(r"\*+|\?|\[[^\]]*\]")
+# Star expansions in a select list: "SELECT *", "a, *", "t.*" and COLUMNS(...),
+# but not COUNT(*). Stray matches only cost a DESCRIBE.
+_SELECT_STAR_RE = re.compile(r"(\bselect\s+(distinct\s+)?|,\s*|\.)\*|\bcolumns\s*\(", re.IGNORECASE)
+# FROM-first queries ("FROM t", "FROM t WHERE ...") project every column implicitly
+_FROM_FIRST_RE = re.compile(r"^\s*from\b", re.IGNORECASE)
+# SELECT * results wider than this are rejected before the scan runs
+MAX_SELECT_STAR_COLUMNS = 20
+
+# Shared in-memory DuckDB database, reused across tool calls so parquet
+# metadata and file handles are not rebuilt on every agent step. Each thread
+# queries through its own cursor, and registers its views as temporary views
+# on that cursor, so concurrent calls cannot repoint each other's tables.
+_CONN = None
+_CONN_LOCK = threading.Lock()
+_THREAD_LOCAL = threading.local()
+DUCKDB_THREADS = os.cpu_count() or 1
+DUCKDB_MEMORY_LIMIT = "4GB"
+
+class _LRUCache:
+    """Thread-safe least-recently-used map from cache keys to tool output strings."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[tuple, str] = OrderedDict()
+        # Tool calls may run concurrently; a lookup must not race an eviction
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> str | None:
+        """Return a cached value and mark it most recently used."""
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: str) -> str:
+        """Store a value, evicting the least recently used entry when full."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return value
+
+# Memoized list_tables_in_directory/get_schema output, keyed by the
+# (path, mtime, size) of what they read so any file change invalidates it
+RESULT_CACHE_SIZE = 128
+_RESULT_CACHE = _LRUCache(RESULT_CACHE_SIZE)
+# SELECT * width verdicts, kept apart so a burst of distinct queries cannot
+# evict the schema and listing results above
+PROJECTION_CACHE_SIZE = 256
+_PROJECTION_CACHE = _LRUCache(PROJECTION_CACHE_SIZE)
+
+def _get_conn() -> duckdb.DuckDBPyConnection:
+    """Return this thread's cursor on the shared DuckDB database, creating it on first use."""
+    global _CONN
+    cursor = getattr(_THREAD_LOCAL, "cursor", None)
+    if cursor is None:
+        with _CONN_LOCK:
+            if _CONN is None:
+                _CONN = duckdb.connect(":memory:")
+                _CONN.execute("PRAGMA enable_object_cache")
+                _CONN.execute("PRAGMA enable_optimizer")
+                _CONN.execute(f"PRAGMA threads={DUCKDB_THREADS}")
+                _CONN.execute(f"PRAGMA memory_limit='{DUCKDB_MEMORY_LIMIT}'")
+            cursor = _CONN.cursor()
+        _THREAD_LOCAL.cursor = cursor
+        # Absolute parquet path -> view name currently registered on this cursor
+        _THREAD_LOCAL.registered = {}
+    return cursor
+
+def _is_glob(file_path: str) -> bool:
+    """Whether a parquet path is a glob pattern rather than a single file.
+
+    A path that exists as written is always a file, so names such as
+    "data[1].parquet" are not mistaken for bracket patterns.
+    """
+    return _GLOB_RE.search(file_path) is not None and not os.path.exists(file_path)
+
+def _table_name(file_path: str) -> str:
+    """Derive a plain SQL identifier from a parquet file name or glob pattern.
+
+    Globs are named after the literal part of their file name ("abnormal_*.parquet"
+    -> abnormal), or after the directory they match in ("logs/*.parquet" -> logs).
+    """
+    name = Path(file_path).stem
+    if _is_glob(file_path):
+        name = _GLOB_RE.sub("", name).strip("_-. ") or Path(_GLOB_RE.split(file_path)[0]).name
+    name = _NON_IDENTIFIER_RE.sub("_", name)
+    return f"t_{name}" if not name or name[0].isdigit() else name
+
+def _adds_filename(conn: duckdb.DuckDBPyConnection, pattern: str) -> bool:
+    """Whether a glob scan can add a `filename` column without clashing with the files' own."""
+    columns = conn.read_parquet(pattern, hive_partitioning=True).columns
+    return "filename" not in (c.lower() for c in columns)
+
+def _read_parquet_glob(conn: duckdb.DuckDBPyConnection, pattern: str) -> duckdb.DuckDBPyRelation:
+    """Scan every file a glob matches as one relation.
+
+    DuckDB reads the files in parallel, exposes key=value directories as columns
+    (pruning partitions on WHERE filters) and adds a `filename` column recording
+    each row's source file, unless the files already have a column by that name.
+    """
+    return conn.read_parquet(pattern, hive_partitioning=True, filename=_adds_filename(conn, pattern))
+
+def _register_view(conn: duckdb.DuckDBPyConnection, file_path: str, table_name: str) -> None:
+    """Create (or repoint) a view over a parquet file, skipping it if already registered.
 
-def _serialize_datetime(obj: Any) -> Any:
-    """Convert datetime objects to ISO format strings for JSON serialization"""
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    elif isinstance(obj, dict):
-        return {key: _serialize_datetime(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [_serialize_datetime(item) for item in obj]
+    `conn` must be this thread's cursor from _get_conn: the view is temporary
+    and only visible through it.
+    """
+    registered = _THREAD_LOCAL.registered
+    abs_path = os.path.abspath(file_path)
+    if registered.get(abs_path) == table_name:
+        return
+    # Bind the path through the relational API rather than interpolating it
+    # into SQL; the view stays a lazy read_parquet scan so filters and column
+    # selections in the user query are pushed down into the parquet reader.
+    if _is_glob(file_path):
+        relation = _read_parquet_glob(conn, file_path)
     else:
-        return obj
+        relation = conn.read_parquet([file_path])
+    conn.register(table_name, relation)
+    # The view name may have pointed at another file before; forget that mapping
+    for path, name in list(registered.items()):
+        if name.lower() == table_name.lower():
+            del registered[path]
+    registered[abs_path] = table_name
 
-def _estimate_token_count(text: str) -> int:
-    """Estimate token count using character-based approximation."""
-    average_chars_per_token = 3
-    return (len(text) + average_chars_per_token - 1) // average_chars_per_token
+def _check_table_refs(query: str, views: dict[str, str]) -> None:
+    """Reject queries that read a view registered by an earlier call.
+
+    Views live on the thread's cursor for the life of the process, so a table
+    name from a previous call would otherwise still resolve to that call's file.
+    Raises CatalogException naming the first such table.
+    """
+    try:
+        referenced = duckdb.get_table_names(query)
+    except Exception:
+        # Unparseable queries fail with a proper error when executed
+        return
+    registered = {name.lower() for name in _THREAD_LOCAL.registered.values()}
+    current = {name.lower() for name in views}
+    for name in sorted(referenced):
+        if name.lower() in registered and name.lower() not in current:
+            raise duckdb.CatalogException(
+                f"Catalog Error: Table with name {name} does not exist! "
+                "It is not one of the parquet_files passed to this call."
+            )
+
+def _format_interval(value: Any) -> str | None:
+    """Format an Arrow MonthDayNano interval the way DuckDB prints INTERVAL values."""
+    if value is None:
+        return None
+    years, months = divmod(value.months, 12)
+    parts = [
+        f"{n} {unit}{'' if n == 1 else 's'}"
+        for n, unit in ((years, "year"), (months, "month"), (value.days, "day"))
+        if n
+    ]
+    if value.nanoseconds or not parts:
+        sign = "-" if value.nanoseconds < 0 else ""
+        seconds, nanos = divmod(abs(value.nanoseconds), 1_000_000_000)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        clock = f"{sign}{hours:02d}:{minutes:02d}:{seconds:02d}"
+        if nanos:
+            clock += f".{nanos // 1000:06d}".rstrip("0")
+        parts.append(clock)
+    return " ".join(parts)
+
+def _json_ready(table: pa.Table) -> pa.Table:
+    """Convert an Arrow result's columns to JSON-friendly types.
+
+    Temporal and decimal columns are converted column-at-a-time in Arrow's
+    compute kernels, so to_pylist() needs no per-cell Python conversion afterwards.
+    """
+    for i, field in enumerate(table.schema):
+        column = table.column(i)
+        if pa.types.is_timestamp(field.type):
+            fmt = "%Y-%m-%dT%H:%M:%S%z" if field.type.tz else "%Y-%m-%dT%H:%M:%S"
+            column = pc.strftime(column, fmt)
+        elif pa.types.is_date(field.type) or pa.types.is_time(field.type) or pa.types.is_duration(field.type):
+            column = pc.cast(column, pa.string())
+        elif pa.types.is_interval(field.type):
+            # DuckDB INTERVAL arrives as month_day_nano, which Arrow cannot cast to string
+            column = pa.array([_format_interval(v) for v in column.to_pylist()], pa.string())
+        elif pa.types.is_decimal(field.type) and field.type.scale == 0:
+            # HUGEINT results such as SUM(bigint) arrive as decimal128(38, 0)
+            try:
+                column = pc.cast(column, pa.int64())
+            except pa.ArrowInvalid:
+                # Beyond int64, where a float would also lose digits
+                column = pc.cast(column, pa.string())
+        elif pa.types.is_decimal(field.type):
+            column = pc.cast(column, pa.float64())
+        else:
+            continue
+        table = table.set_column(i, field.name, column)
+    return table
 
-def _enforce_token_limit(payload: str, context: str) -> str:
-    """Ensure payload stays within the token budget before returning"""
-    token_estimate = _estimate_token_count(payload)
-    if token_estimate <= TOKEN_LIMIT:
-        return payload
+def _fetch_arrow(cursor: duckdb.DuckDBPyConnection, limit: int) -> pa.Table:
+    """Stream at most `limit` rows of the pending result as an Arrow table."""
+    reader = cursor.to_arrow_reader(limit)
+    batches = []
+    num_rows = 0
+    for batch in reader:
+        batches.append(batch)
+        num_rows += batch.num_rows
+        if num_rows >= limit:
+            break
+    return pa.Table.from_batches(batches, schema=reader.schema).slice(0, limit)
 
+@lru_cache(maxsize=1)
+def _get_encoding() -> Any:
+    """Load the cl100k_base tokenizer once, or None if tiktoken is unavailable."""
     try:
-        current_size = len(json.loads(payload)) if payload.startswith("[") else None
-    except json.JSONDecodeError:
-        current_size = None
-        
-    suggested_limit = None
-    if current_size:
-        ratio = TOKEN_LIMIT / token_estimate
-        suggested_limit = max(1, int(current_size * ratio * 0.8))
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Not installed, or the BPE file could not be downloaded
+        return None
+
+def _estimate_token_count(text: str) -> int:
+    """Estimate token count with tiktoken, falling back to a character-based approximation."""
+    encoding = _get_encoding()
+    if encoding is None:
+        average_chars_per_token = 3
+        return (len(text) + average_chars_per_token - 1) // average_chars_per_token
+
+    if len(text) <= TOKEN_SAMPLE_THRESHOLD:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    # Encode only the head and tail and extrapolate the tokens-per-char ratio
+    sample = text[:TOKEN_SAMPLE_CHARS] + text[-TOKEN_SAMPLE_CHARS:]
+    sample_tokens = len(encoding.encode(sample, disallowed_special=()))
+    return -(-sample_tokens * len(text) // len(sample))
+
+def _dumps(obj: Any) -> str:
+    """Serialize a tool result to compact JSON (indentation only costs tokens).
+
+    Uses orjson when installed, falling back to the standard library.
+    """
+    # default=str covers values nested inside LIST/STRUCT columns
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+        except orjson.JSONEncodeError:
+            # e.g. HUGEINT values beyond orjson's 64-bit integer range
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def _truncate(text: str) -> str:
+    """Shorten a value reported in a summary to SUMMARY_VALUE_CHARS characters."""
+    return text if len(text) <= SUMMARY_VALUE_CHARS else text[: SUMMARY_VALUE_CHARS - 3] + "..."
+
+def _has_short_values(column: pa.ChunkedArray, data_type: pa.DataType) -> bool:
+    """Whether a column's values are short enough to report as top values."""
+    if pa.types.is_binary(data_type) or pa.types.is_large_binary(data_type) or pa.types.is_fixed_size_binary(data_type):
+        return False
+    if pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        longest = pc.max(pc.utf8_length(column)).as_py()
+        return longest is None or longest <= SUMMARY_MAX_VALUE_CHARS
+    return True
+
+def _summarize_table(table: pa.Table) -> dict[str, Any]:
+    """Compute per-column statistics with Arrow compute kernels."""
+    summary = {}
+    for i, field in enumerate(table.schema):
+        column = table.column(i)
+        stats: dict[str, Any] = {"nulls": column.null_count}
+        if pa.types.is_nested(field.type):
+            summary[field.name] = stats
+            continue
+
+        stats["distinct"] = pc.count_distinct(column).as_py()
+        if (
+            pa.types.is_integer(field.type)
+            or pa.types.is_floating(field.type)
+            or pa.types.is_decimal(field.type)
+            or pa.types.is_timestamp(field.type)
+            or pa.types.is_date(field.type)
+        ):
+            stats.update(pc.min_max(column).as_py())
+        elif stats["distinct"] < len(column) and _has_short_values(column, field.type):
+            # Skipped for unique columns (IDs, messages) where every count is 1
+            counts = pc.value_counts(column)
+            top = counts.take(pc.sort_indices(counts.field("counts"), sort_keys=[("", "descending")])[:SUMMARY_TOP_VALUES])
+            stats["top_values"] = {_truncate(str(item["values"])): item["counts"] for item in top.to_pylist()}
+        summary[field.name] = stats
+    return summary
+
+def _truncation_note(num_rows: int) -> str:
+    """Plain-text note appended to a result cut off at the row limit."""
+    return (
+        f"\n(Showing the first {num_rows} rows; the query returned more. "
+        "Use WHERE filters or aggregation to narrow it, or raise `limit`.)"
+    )
+
+def _enforce_token_limit(table: pa.Table, context: str, truncated: bool = False) -> str:
+    """Serialize a query result if it fits the token budget, otherwise return a warning.
+
+    `truncated` marks a result cut off at the caller's row limit; the model is
+    told so, since otherwise it cannot tell the rows are not the full answer.
+
+    The token count is first extrapolated from the first few rows, which rejects
+    clearly oversized results before they are converted or serialized in full:
+    those whose sample rows alone exceed the budget, or whose estimate exceeds
+    it by TOKEN_ESTIMATE_MARGIN. Anything else is serialized and measured for
+    real, since the leading rows may be much longer or shorter than the rest.
+    The warning carries a small sample and a per-column summary instead of the
+    rows.
+    """
+    prepared = _json_ready(table)
+    sample = prepared.slice(0, TOKEN_SAMPLE_ROWS).to_pylist()
+    sample_json = _dumps(sample)
+    sample_tokens = _estimate_token_count(sample_json)
+    payload = None
+    if table.num_rows <= TOKEN_SAMPLE_ROWS:
+        payload, token_estimate = sample_json, sample_tokens
+    else:
+        token_estimate = -(-sample_tokens * table.num_rows // TOKEN_SAMPLE_ROWS)
+        if sample_tokens <= TOKEN_LIMIT and token_estimate <= TOKEN_LIMIT * TOKEN_ESTIMATE_MARGIN:
+            payload = _dumps(prepared.to_pylist())
+            token_estimate = _estimate_token_count(payload)
+    if payload is not None and token_estimate <= TOKEN_LIMIT:
+        return payload + _truncation_note(table.num_rows) if truncated else payload
+
+    current_size = table.num_rows
+    ratio = TOKEN_LIMIT / token_estimate
+    suggested_limit = max(1, int(current_size * ratio * 0.8))
 
     suggestion_parts = [
         "The query result is too large. Please adjust your query:",
-        "  • Reduce the LIMIT value" + (f" (try LIMIT {suggested_limit})" if suggested_limit else ""),
+        f"  • Reduce the LIMIT value (try LIMIT {suggested_limit})",
         "  • Filter rows with WHERE clauses to reduce result size",
         "  • Select only necessary columns instead of SELECT *",
         "  • Use aggregation (COUNT, SUM, AVG) instead of retrieving raw rows",
@@ -54,26 +436,131 @@ def _enforce_token_limit(payload: str, context: str) -> str:
         "estimated_tokens": token_estimate,
         "token_limit": TOKEN_LIMIT,
         "rows_returned": current_size,
+        "more_rows_available": truncated,
         "suggested_limit": suggested_limit,
         "suggestion": "\n".join(suggestion_parts),
     }
-    return json.dumps(warning, ensure_ascii=False, indent=2)
+    if sample_tokens <= TOKEN_LIMIT // 2:
+        warning["sample"] = sample
+    summary = _summarize_table(table)
+    warning["summary"] = summary
+
+    # The warning must fit the budget too: shed the sample, then the top
+    # values, then the summary itself until it does
+    payload = _dumps(warning)
+    for shrink in ("sample", "top_values", "summary"):
+        if _estimate_token_count(payload) <= TOKEN_LIMIT:
+            break
+        if shrink == "top_values":
+            for stats in summary.values():
+                stats.pop("top_values", None)
+        else:
+            warning.pop(shrink, None)
+        payload = _dumps(warning)
+    return payload
+
+def _limit_query(query: str, limit: int) -> tuple[str, list[Any]]:
+    """Push the row limit into SQL so DuckDB stops producing rows we would discard.
+
+    Returns the query to execute and its parameters. Queries that already end in
+    a LIMIT, or that are not plain SELECT statements, are returned unchanged.
+    """
+    stripped = query.strip().rstrip(";").rstrip()
+    if not _WRAPPABLE_QUERY_RE.match(stripped) or _OUTER_LIMIT_RE.search(stripped):
+        return query, []
+    # Newlines keep a trailing "-- comment" in the user query from swallowing the wrapper
+    return f"SELECT * FROM (\n{stripped}\n) AS _sub LIMIT ?", [limit]
+
+def _check_projection(conn: duckdb.DuckDBPyConnection, query: str, views: dict[str, str], context: str) -> str | None:
+    """Reject star-expanding (or FROM-first) queries that would project a wide table.
+
+    The query is only bound via DESCRIBE, never executed. The verdict is cached
+    per query text and view bindings. Returns a warning payload, or None if the
+    query may run.
+    """
+    stripped = query.strip().rstrip(";").rstrip()
+    if not _WRAPPABLE_QUERY_RE.match(stripped):
+        return None
+    if not _SELECT_STAR_RE.search(stripped) and not _FROM_FIRST_RE.match(stripped):
+        return None
+
+    cache_key = ("check_projection", stripped, tuple(sorted(views.items())))
+    cached = _PROJECTION_CACHE.get(cache_key)
+    if cached is None:
+        columns = [row[0] for row in conn.execute(f"DESCRIBE {stripped}").fetchall()]
+        cached = ""
+        if len(columns) > MAX_SELECT_STAR_COLUMNS:
+            cached = _dumps({
+                "error": "Query selects too many columns",
+                "context": context,
+                "columns_selected": len(columns),
+                "column_limit": MAX_SELECT_STAR_COLUMNS,
+                "available_columns": columns[:100],
+                "suggestion": (
+                    f"The query returns {len(columns)} columns. Specify only the columns you need "
+                    "so DuckDB can skip reading the rest from the parquet files."
+                ),
+            })
+        _PROJECTION_CACHE.put(cache_key, cached)
+    return cached or None
+
+def _parquet_path_exists(file_path: str) -> bool:
+    """Whether a parquet file exists, or a glob pattern matches at least one file."""
+    if _is_glob(file_path):
+        return next(glob.iglob(file_path, recursive=True), None) is not None
+    return os.path.exists(file_path)
 
 def _validate_parquet_files(parquet_files: Union[str, List[str]]) -> List[str]:
     """Validate parquet files exist and return as list."""
     if isinstance(parquet_files, str):
         parquet_files = [parquet_files]
 
-    for file_path in parquet_files:
-        if not os.path.exists(file_path):
-             if not Path(file_path).exists():
-                raise FileNotFoundError(
-                    f"Parquet file not found: {file_path}\n"
-                    f"Please check the file path and ensure the file exists. "
-                    f"You may use 'list_tables_in_directory' to discover available parquet files."
-                )
+    missing = [file_path for file_path in parquet_files if not _parquet_path_exists(file_path)]
+    if missing:
+        raise FileNotFoundError(
+            f"Parquet file not found: {', '.join(missing)}\n"
+            f"Please check the file path and ensure the file exists. "
+            f"You may use 'list_tables_in_directory' to discover available parquet files."
+        )
     return parquet_files
 
+def _stat_key(file_path: str) -> tuple:
+    """Identify the current version of a parquet file (or every file a glob matches)."""
+    if _is_glob(file_path):
+        return (file_path, *(_stat_key(p) for p in sorted(glob.glob(file_path, recursive=True))))
+    stat = os.stat(file_path)
+    return (file_path, stat.st_mtime_ns, stat.st_size)
+
+def _read_parquet_schema(conn: duckdb.DuckDBPyConnection, file_path: str) -> list[dict[str, str]]:
+    """Read top-level column names and DuckDB types from a parquet footer."""
+    if _is_glob(file_path):
+        # Partition and filename columns only exist on the combined scan, so bind it
+        relation = _read_parquet_glob(conn, file_path)
+        return [{"column_name": c, "column_type": str(t)} for c, t in zip(relation.columns, relation.types)]
+
+    # parquet_schema() flattens the schema tree depth-first and row 0 is the root
+    # element, so until the first group row every row is a top-level column.
+    rows = conn.execute("SELECT name, duckdb_type, num_children FROM parquet_schema(?)", [file_path]).fetchall()
+    columns = []
+    for name, column_type, num_children in rows[1:]:
+        if num_children:
+            # Nested (STRUCT/LIST/MAP) columns have no duckdb_type; let DuckDB bind the full type
+            result = conn.execute("DESCRIBE SELECT * FROM read_parquet(?)", [file_path]).fetchall()
+            return [{"column_name": r[0], "column_type": r[1]} for r in result]
+        columns.append({"column_name": name, "column_type": column_type})
+    return columns
+
+def get_analysis_playbook() -> str:
+    """
+    Get the step-by-step root cause analysis workflow with example SQL queries.
+
+    Call this once at the start of an investigation.
+
+    Returns:
+        The analysis workflow as markdown text.
+    """
+    return ANALYSIS_PLAYBOOK.strip()
+
 def list_tables_in_directory(directory: str) -> str:
     """
     List all parquet files in the given directory.
@@ -85,11 +572,18 @@ def list_tables_in_directory(directory: str) -> str:
         A JSON string containing a list of parquet filenames found.
     """
     try:
-        if not os.path.exists(directory):
-            return f"Error: Directory '{directory}' does not exist."
-        
-        files = [f for f in os.listdir(directory) if f.endswith('.parquet')]
-        return json.dumps(files, indent=2)
+        # Adding or removing entries bumps the directory mtime
+        cache_key = ("list_tables_in_directory", directory, os.stat(directory).st_mtime_ns)
+        cached = _RESULT_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # DirEntry.is_file() uses the type from the directory read, avoiding a stat per entry
+        with os.scandir(directory) as entries:
+            files = [e.name for e in entries if e.name.endswith('.parquet') and e.is_file()]
+        return _RESULT_CACHE.put(cache_key, _dumps(files))
+    except FileNotFoundError:
+        return f"Error: Directory '{directory}' does not exist."
     except Exception as e:
         return f"Error listing files: {str(e)}"
 
@@ -98,28 +592,29 @@ def get_schema(parquet_files: Union[str, List[str]]) -> str:
     Get the schema (column names and types) of parquet file(s).
     
     Args:
-        parquet_files: Path(s) to parquet file(s).
+        parquet_files: Path(s) to parquet file(s), or glob patterns such as "logs/*.parquet".
         
     Returns:
         A JSON string describing the columns and their data types for each file.
     """
     try:
         parquet_files = _validate_parquet_files(parquet_files)
-        conn = duckdb.connect(":memory:")
+        cache_key = ("get_schema",) + tuple(_stat_key(p) for p in parquet_files)
+        cached = _RESULT_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
+        conn = _get_conn()
         schemas = {}
         
         for file_path in parquet_files:
-            file_name = Path(file_path).name
+            file_name = file_path if _is_glob(file_path) else Path(file_path).name
             try:
-                query = f"DESCRIBE SELECT * FROM read_parquet('{file_path}')"
-                result = conn.execute(query).fetchall()
-                # Format: column_name, column_type, ...
-                columns = [{"column_name": r[0], "column_type": r[1]} for r in result]
-                schemas[file_name] = columns
+                schemas[file_name] = _read_parquet_schema(conn, file_path)
             except Exception as e:
                 schemas[file_name] = f"Error reading schema: {str(e)}"
                 
-        return json.dumps(schemas, indent=2)
+        return _RESULT_CACHE.put(cache_key, _dumps(schemas))
     except Exception as e:
         return f"Error getting schema: {str(e)}"
 
@@ -128,47 +623,64 @@ def query_parquet_files(parquet_files: Union[str, List[str]], query: str, limit:
     Query parquet files using SQL syntax for data analysis and exploration.
     
     The tool automatically registers the provided parquet files as tables (views) 
-    using their filenames (without extension) as table names.
+    using their filenames (without extension) as table names. Characters other
+    than letters, digits and underscores become underscores, and names starting
+    with a digit get a "t_" prefix (e.g. "span-metrics.parquet" -> span_metrics).
+
+    Filters in the WHERE clause and explicitly selected columns are pushed down
+    into the parquet scan, letting DuckDB skip row groups using their min/max
+    statistics. Prefer narrow column lists and WHERE filters over SELECT *.
+
+    A glob pattern (e.g. "logs/*.parquet" or "data/**/*.parquet") registers all
+    matching files as a single table with one parallel scan, named after the
+    pattern's file name or directory. Hive-style key=value directories become
+    columns, and a `filename` column records each row's source file (unless the
+    files already have a `filename` column of their own).
     
     Args:
-        parquet_files: Path(s) to parquet file(s) to be queried.
+        parquet_files: Path(s) to parquet file(s) or glob patterns to be queried.
         query: SQL query to execute. Use table names corresponding to filenames.
         limit: Maximum number of records to return (default 50).
         
     Returns:
-        JSON string of query results.
+        JSON string of query results, followed by a short note when more than
+        `limit` rows matched.
     """
+    table_names = set()
     try:
         parquet_files = _validate_parquet_files(parquet_files)
-        conn = duckdb.connect(":memory:")
-        table_names = set()
+        conn = _get_conn()
         
-        # Register views
+        # Register views; DuckDB identifiers are case-insensitive, so are the names
+        views = {}
+        taken = set()
         for file_path in parquet_files:
-            base_name = Path(file_path).stem
+            base_name = _table_name(file_path)
             table_name = base_name
             counter = 1
-            while table_name in table_names:
+            while table_name.lower() in taken:
                 table_name = f"{base_name}_{counter}"
                 counter += 1
+            taken.add(table_name.lower())
             table_names.add(table_name)
-            # Use read_parquet for safety and flexibility
-            conn.execute(f"CREATE VIEW {table_name} AS SELECT * FROM read_parquet('{file_path}')")
-            
-        # Execute query
-        result = conn.execute(query).fetchall()
-        if not result:
+            views[table_name] = os.path.abspath(file_path)
+            _register_view(conn, file_path, table_name)
+        _check_table_refs(query, views)
+
+        warning = _check_projection(conn, query, views, "query_parquet_files")
+        if warning:
+            return warning
+
+        # Execute query, fetching one row past `limit` to tell whether it was cut off
+        sql, params = _limit_query(query, limit + 1)
+        cursor = conn.execute(sql, params)
+        # Already bounded by SQL when wrapped; otherwise stop reading after limit + 1 rows
+        table = cursor.to_arrow_table() if params else _fetch_arrow(cursor, limit + 1)
+        if table.num_rows == 0:
              return "Query executed successfully but returned no results."
 
-        columns = [desc[0] for desc in conn.description]
-        rows = [dict(zip(columns, row)) for row in result]
-        serialized_rows = _serialize_datetime(rows)
-        
-        if len(serialized_rows) > limit:
-            serialized_rows = serialized_rows[:limit]
-            
-        result_json = json.dumps(serialized_rows, ensure_ascii=False, indent=2)
-        return _enforce_token_limit(result_json, "query_parquet_files")
+        truncated = table.num_rows > limit
+        return _enforce_token_limit(table.slice(0, limit), "query_parquet_files", truncated)
         
     except Exception as e:
         # Improved error handling from attachment
@@ -182,3 +694,43 @@ def query_parquet_files(parquet_files: Union[str, List[str]], query: str, limit:
                      f"Available tables: {list(table_names)}")
         else:
             return f"Query execution failed: {error_msg}"
+
+def summarize_column(parquet_file: str, column: str, where: str = "", limit: int = 50) -> str:
+    """
+    Count rows per distinct value of one column, most frequent first.
+
+    Only the grouped column (and any columns used in `where`) are read from the
+    parquet file, so this is much cheaper than SELECT * on wide tables. Prefer it
+    over query_parquet_files for "which values occur and how often" questions.
+
+    Args:
+        parquet_file: Path to a parquet file, or a glob pattern such as "logs/*.parquet".
+        column: Name of the column to group by.
+        where: Optional SQL filter condition without the WHERE keyword, e.g. "level = 'ERROR'".
+        limit: Maximum number of distinct values to return (default 50).
+
+    Returns:
+        JSON string of {column: value, "count": n} rows ordered by count. When the
+        column is itself named "count", the counts are reported as "row_count".
+    """
+    try:
+        file_path = _validate_parquet_files(parquet_file)[0]
+        conn = _get_conn()
+        source = "read_parquet(?)"
+        if _is_glob(file_path):
+            filename = "true" if _adds_filename(conn, file_path) else "false"
+            source = f"read_parquet(?, hive_partitioning = true, filename = {filename})"
+        quoted_column = '"' + column.replace('"', '""') + '"'
+        # DuckDB names are case-insensitive, so "Count" would clash too
+        count_alias = "row_count" if column.lower() == "count" else "count"
+        where_clause = f"WHERE {where}" if where.strip() else ""
+        query = (
+            f'SELECT {quoted_column}, COUNT(*) AS "{count_alias}" FROM {source} {where_clause} '
+            f'GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT ?'
+        )
+        table = conn.execute(query, [file_path, limit]).to_arrow_table()
+        if table.num_rows == 0:
+            return "Query executed successfully but returned no results."
+        return _enforce_token_limit(table, "summarize_column")
+    except Exception as e:
+        return f"Error summarizing column: {str(e)}"
@@ -0,0 +1,423 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from examples.rca import tools
+
+
+def write_parquet(path, **columns):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.table(columns), path)
+    return str(path)
+
+
+class TestLimitQuery:
+    def test_wraps_select(self):
+        sql, params = tools._limit_query("select a from t", 50)
+        assert sql == "SELECT * FROM (\nselect a from t\n) AS _sub LIMIT ?"
+        assert params == [50]
+
+    def test_strips_trailing_semicolon(self):
+        sql, params = tools._limit_query("  SELECT a FROM t;  ", 10)
+        assert sql == "SELECT * FROM (\nSELECT a FROM t\n) AS _sub LIMIT ?"
+        assert params == [10]
+
+    def test_trailing_comment_does_not_swallow_wrapper(self):
+        sql, params = tools._limit_query("select a from range(3) t(a) -- note", 5)
+        assert sql.endswith("\n) AS _sub LIMIT ?")
+        assert duckdb.connect().execute(sql, params).fetchall() == [(0,), (1,), (2,)]
+
+    @pytest.mark.parametrize("query", ["with x as (select 1) select * from x", "from t", "values (1), (2)"])
+    def test_wraps_other_select_forms(self, query):
+        _, params = tools._limit_query(query, 7)
+        assert params == [7]
+
+    @pytest.mark.parametrize("query", ["select a from t limit 5", "select a from t LIMIT 5 OFFSET 10;"])
+    def test_keeps_existing_outer_limit(self, query):
+        assert tools._limit_query(query, 50) == (query, [])
+
+    @pytest.mark.parametrize("query", ["describe t", "show tables", "pragma version"])
+    def test_leaves_non_select_statements(self, query):
+        assert tools._limit_query(query, 50) == (query, [])
+
+
+class TestTableName:
+    @pytest.mark.parametrize(
+        ("path", "expected"),
+        [
+            ("data/abnormal_traces.parquet", "abnormal_traces"),
+            ("span-metrics.parquet", "span_metrics"),
+            ("my file.v2.parquet", "my_file_v2"),
+            ("2024_logs.parquet", "t_2024_logs"),
+        ],
+    )
+    def test_sanitizes_file_names(self, path, expected):
+        assert tools._table_name(path) == expected
+
+
+class TestGlobs:
+    @pytest.mark.parametrize(
+        ("pattern", "expected"),
+        [
+            ("data/abnormal_*.parquet", "abnormal"),
+            ("logs/*.parquet", "logs"),
+            ("data/**/*.parquet", "data"),
+        ],
+    )
+    def test_names_globs(self, pattern, expected):
+        assert tools._table_name(pattern) == expected
+
+    def test_existing_bracketed_file_is_not_a_glob(self, tmp_path):
+        path = write_parquet(tmp_path / "data[1].parquet", a=[1])
+        assert not tools._is_glob(path)
+        assert tools._table_name(path) == "data_1_"
+        assert json.loads(tools.query_parquet_files(path, "select a from data_1_")) == [{"a": 1}]
+
+    def test_glob_is_one_table_with_partitions_and_filename(self, tmp_path):
+        write_parquet(tmp_path / "logs" / "day=1" / "part.parquet", level=["INFO", "ERROR"])
+        write_parquet(tmp_path / "logs" / "day=2" / "part.parquet", level=["ERROR"])
+        pattern = str(tmp_path / "logs" / "**" / "*.parquet")
+        result = tools.query_parquet_files(
+            pattern, "select day, count(*) as n, count(distinct filename) as files from logs group by 1 order by 1"
+        )
+        assert json.loads(result) == [{"day": 1, "n": 2, "files": 1}, {"day": 2, "n": 1, "files": 1}]
+        columns = json.loads(tools.get_schema(pattern))[pattern]
+        assert [c["column_name"] for c in columns] == ["level", "filename", "day"]
+
+    def test_files_with_their_own_filename_column(self, tmp_path):
+        for name in ("a", "b"):
+            write_parquet(tmp_path / "uploads" / f"{name}.parquet", filename=[f"{name}.csv"], size=[1])
+        pattern = str(tmp_path / "uploads" / "*.parquet")
+        result = tools.query_parquet_files(pattern, "select filename from uploads order by 1")
+        assert json.loads(result) == [{"filename": "a.csv"}, {"filename": "b.csv"}]
+        columns = json.loads(tools.get_schema(pattern))[pattern]
+        assert [c["column_name"] for c in columns] == ["filename", "size"]
+        assert json.loads(tools.summarize_column(pattern, "size")) == [{"size": 1, "count": 2}]
+
+    def test_glob_without_matches(self, tmp_path):
+        result = tools.query_parquet_files(str(tmp_path / "*.parquet"), "select 1")
+        assert "Parquet file not found" in result
+
+
+class TestJsonReady:
+    def test_converts_temporal_decimal_and_interval_columns(self):
+        table = duckdb.sql(
+            "SELECT TIMESTAMP '2024-01-02 03:04:05' AS ts, DATE '2024-01-02' AS d, "
+            "1.25::DECIMAL(5, 2) AS amount, INTERVAL '1 month 2 days 03:04:05' AS iv, "
+            "INTERVAL '-90 minutes' AS neg, 'x' AS s"
+        ).to_arrow_table()
+        row = tools._json_ready(table).to_pylist()[0]
+        assert row["ts"].startswith("2024-01-02T03:04:05")
+        assert row["d"] == "2024-01-02"
+        assert row["amount"] == 1.25
+        assert row["iv"] == "1 month 2 days 03:04:05"
+        assert row["neg"] == "-01:30:00"
+        assert row["s"] == "x"
+
+    def test_keeps_hugeint_sums_integral(self):
+        table = duckdb.sql(
+            "SELECT SUM(i) AS total, 170141183460469231731687303715884105727::HUGEINT AS huge "
+            "FROM range(1000) t(i)"
+        ).to_arrow_table()
+        assert pa.types.is_decimal(table.schema.field("total").type)
+        row = tools._json_ready(table).to_pylist()[0]
+        assert row == {"total": 499500, "huge": "170141183460469231731687303715884105727"}
+        assert tools._dumps(row) == '{"total":499500,"huge":"170141183460469231731687303715884105727"}'
+
+
+class TestEnforceTokenLimit:
+    def test_small_result_is_returned_as_rows(self):
+        table = pa.table({"i": [1, 2, 3], "msg": ["a", "b", "c"]})
+        assert json.loads(tools._enforce_token_limit(table, "test")) == table.to_pylist()
+
+    def test_measures_rows_beyond_the_sample(self):
+        # Short leading rows must not hide the large ones after them
+        msgs = ["short"] * tools.TOKEN_SAMPLE_ROWS + ["x" * 3400] * 45
+        table = pa.table({"i": list(range(len(msgs))), "msg": msgs})
+        result = json.loads(tools._enforce_token_limit(table, "test"))
+        assert result["error"] == "Result exceeds token budget"
+        assert result["estimated_tokens"] > tools.TOKEN_LIMIT
+
+    def test_long_leading_rows_do_not_reject_a_small_result(self):
+        # Extrapolating from five long rows overestimates the whole result
+        msgs = ["x" * 1200] * tools.TOKEN_SAMPLE_ROWS + ["ok"] * 45
+        table = pa.table({"i": list(range(len(msgs))), "msg": msgs})
+        result = tools._enforce_token_limit(table, "test")
+        assert json.loads(result) == table.to_pylist()
+
+    def test_rejects_when_the_sample_alone_is_over_budget(self):
+        table = pa.table({"msg": ["x" * (tools.TOKEN_LIMIT * 4)] * 10})
+        result = json.loads(tools._enforce_token_limit(table, "test"))
+        assert result["error"] == "Result exceeds token budget"
+        assert result["rows_returned"] == 10
+
+
+class TestBudgetWarning:
+    def test_warning_with_long_values_fits_the_budget(self):
+        traces = [f"Traceback {i}\n" + "  at frame\n" * 1000 for i in range(5)]
+        table = pa.table({"trace": traces * 40})
+        payload = tools._enforce_token_limit(table, "test")
+        result = json.loads(payload)
+        assert result["error"] == "Result exceeds token budget"
+        assert tools._estimate_token_count(payload) <= tools.TOKEN_LIMIT
+        assert "top_values" not in result["summary"]["trace"]
+
+    def test_top_values_are_truncated(self):
+        values = [f"{i}:" + "e" * (tools.SUMMARY_MAX_VALUE_CHARS - 10) for i in range(5)]
+        table = pa.table({"msg": values * 100})
+        result = json.loads(tools._enforce_token_limit(table, "test"))
+        top_values = result["summary"]["msg"]["top_values"]
+        assert len(top_values) == 5
+        assert all(len(value) <= tools.SUMMARY_VALUE_CHARS for value in top_values)
+        assert sum(top_values.values()) == 500
+
+    def test_summary_reports_numeric_ranges(self):
+        table = pa.table({"latency": list(range(2000)), "service": ["cart", "auth"] * 1000})
+        summary = json.loads(tools._enforce_token_limit(table, "test"))["summary"]
+        assert summary["latency"] == {"nulls": 0, "distinct": 2000, "min": 0, "max": 1999}
+        assert summary["service"]["top_values"] == {"cart": 1000, "auth": 1000}
+
+
+class TestQueryParquetFiles:
+    def test_queries_registered_file(self, tmp_path):
+        path = write_parquet(tmp_path / "logs.parquet", level=["INFO", "ERROR", "ERROR"])
+        result = tools.query_parquet_files(path, "select level, count(*) as n from logs group by 1 order by 1")
+        assert json.loads(result) == [{"level": "ERROR", "n": 2}, {"level": "INFO", "n": 1}]
+
+    def test_joins_several_files(self, tmp_path):
+        spans = write_parquet(tmp_path / "spans.parquet", trace_id=["a", "b"], service=["cart", "auth"])
+        logs = write_parquet(tmp_path / "logs.parquet", trace_id=["a", "a", "b"], msg=["x", "y", "z"])
+        result = tools.query_parquet_files(
+            [spans, logs],
+            "select service, count(*) as n from spans join logs using (trace_id) group by 1 order by 1",
+        )
+        assert json.loads(result) == [{"service": "auth", "n": 1}, {"service": "cart", "n": 2}]
+
+    def test_empty_result(self, tmp_path):
+        path = write_parquet(tmp_path / "logs.parquet", level=["INFO"])
+        result = tools.query_parquet_files(path, "select * from logs where level = 'ERROR'")
+        assert result == "Query executed successfully but returned no results."
+
+    def test_missing_file(self, tmp_path):
+        result = tools.query_parquet_files(str(tmp_path / "nope.parquet"), "select 1")
+        assert "Parquet file not found" in result
+
+    def test_view_follows_the_file_passed_in(self, tmp_path):
+        first = write_parquet(tmp_path / "a" / "logs.parquet", src=["a"])
+        second = write_parquet(tmp_path / "b" / "logs.parquet", src=["b"])
+        assert json.loads(tools.query_parquet_files(first, "select src from logs")) == [{"src": "a"}]
+        assert json.loads(tools.query_parquet_files(second, "select src from logs")) == [{"src": "b"}]
+        assert json.loads(tools.query_parquet_files(first, "select src from logs")) == [{"src": "a"}]
+
+    def test_names_differing_only_in_case_get_distinct_views(self, tmp_path):
+        lower = write_parquet(tmp_path / "d1" / "logs.parquet", src=["d1"])
+        upper = write_parquet(tmp_path / "d2" / "Logs.parquet", src=["d2"])
+        assert json.loads(tools.query_parquet_files([lower, upper], "select src from logs")) == [{"src": "d1"}]
+        assert json.loads(tools.query_parquet_files([lower, upper], "select src from Logs_1")) == [{"src": "d2"}]
+
+    def test_rejects_view_from_an_earlier_call(self, tmp_path):
+        earlier = write_parquet(tmp_path / "earlier_logs.parquet", src=["old"])
+        current = write_parquet(tmp_path / "metrics.parquet", value=[1])
+        tools.query_parquet_files(earlier, "select * from earlier_logs")
+        result = tools.query_parquet_files(current, "select * from earlier_logs")
+        assert result.startswith("Table reference error:")
+        assert "earlier_logs" in result
+
+    def test_notes_rows_cut_off_at_the_limit(self, tmp_path):
+        path = write_parquet(tmp_path / "numbers.parquet", i=list(range(10)))
+        result = tools.query_parquet_files(path, "select i from numbers order by i", limit=3)
+        rows, note = result.split("\n", 1)
+        assert json.loads(rows) == [{"i": 0}, {"i": 1}, {"i": 2}]
+        assert "first 3 rows" in note
+
+    @pytest.mark.parametrize("query", ["select i from numbers order by i limit 3", "select i from numbers order by i limit 8"])
+    def test_own_limit_is_respected(self, tmp_path, query):
+        path = write_parquet(tmp_path / "numbers.parquet", i=list(range(10)))
+        result = tools.query_parquet_files(path, query, limit=3)
+        rows, _, note = result.partition("\n")
+        assert json.loads(rows) == [{"i": 0}, {"i": 1}, {"i": 2}]
+        assert bool(note) == query.endswith("limit 8")
+
+    def test_result_at_the_limit_has_no_note(self, tmp_path):
+        path = write_parquet(tmp_path / "numbers.parquet", i=list(range(3)))
+        result = tools.query_parquet_files(path, "select i from numbers order by i", limit=3)
+        assert json.loads(result) == [{"i": 0}, {"i": 1}, {"i": 2}]
+
+
+class TestResultCache:
+    def test_get_schema_is_cached_until_the_file_changes(self, tmp_path):
+        path = write_parquet(tmp_path / "logs.parquet", a=[1])
+        first = tools.get_schema(path)
+        assert tools.get_schema(path) is first
+        write_parquet(tmp_path / "logs.parquet", a=[1], b=["x"])
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+        columns = json.loads(tools.get_schema(path))["logs.parquet"]
+        assert [c["column_name"] for c in columns] == ["a", "b"]
+
+    def test_listing_is_cached_until_the_directory_changes(self, tmp_path):
+        write_parquet(tmp_path / "a.parquet", x=[1])
+        first = tools.list_tables_in_directory(str(tmp_path))
+        assert tools.list_tables_in_directory(str(tmp_path)) is first
+        write_parquet(tmp_path / "b.parquet", x=[1])
+        os.utime(tmp_path, ns=(0, os.stat(tmp_path).st_mtime_ns + 1_000_000_000))
+        assert sorted(json.loads(tools.list_tables_in_directory(str(tmp_path)))) == ["a.parquet", "b.parquet"]
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = tools._LRUCache(2)
+        cache.put(("a",), "1")
+        cache.put(("b",), "2")
+        assert cache.get(("a",)) == "1"
+        cache.put(("c",), "3")
+        assert cache.get(("b",)) is None
+        assert cache.get(("a",)) == "1"
+        assert cache.get(("c",)) == "3"
+
+
+class TestCheckProjection:
+    @pytest.fixture
+    def wide(self, tmp_path):
+        return write_parquet(tmp_path / "wide.parquet", **{f"c{i}": [i] for i in range(25)})
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "select * from wide",
+            "SELECT DISTINCT * FROM wide",
+            "select c1, * from wide",
+            "select wide.* from wide",
+            "select w.* from wide w where c1 = 1",
+            "select columns('c.*') from wide",
+            "from wide",
+            "from wide where c1 = 1",
+        ],
+    )
+    def test_rejects_wide_projections(self, wide, query):
+        result = json.loads(tools.query_parquet_files(wide, query))
+        assert result["error"] == "Query selects too many columns"
+        assert result["columns_selected"] >= 25
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "select c1, c2 from wide",
+            "select count(*) as n from wide",
+            "select * exclude (c0) from (select c0, c1 from wide)",
+            "from wide select c1",
+        ],
+    )
+    def test_allows_narrow_projections(self, wide, query):
+        assert isinstance(json.loads(tools.query_parquet_files(wide, query)), list)
+
+    def test_narrow_table_passes(self, tmp_path):
+        path = write_parquet(tmp_path / "narrow.parquet", a=[1], b=[2])
+        assert json.loads(tools.query_parquet_files(path, "select * from narrow")) == [{"a": 1, "b": 2}]
+
+
+class TestListTablesInDirectory:
+    def test_lists_only_parquet_files(self, tmp_path):
+        write_parquet(tmp_path / "logs.parquet", x=[1])
+        (tmp_path / "notes.txt").write_text("x")
+        (tmp_path / "partitioned.parquet").mkdir()
+        assert json.loads(tools.list_tables_in_directory(str(tmp_path))) == ["logs.parquet"]
+
+    def test_missing_directory(self, tmp_path):
+        missing = str(tmp_path / "missing")
+        assert tools.list_tables_in_directory(missing) == f"Error: Directory '{missing}' does not exist."
+
+
+class TestConcurrentQueries:
+    def test_same_table_name_from_different_directories(self, tmp_path):
+        paths = {src: write_parquet(tmp_path / src / "logs.parquet", src=[src] * 100) for src in ("c1", "c2")}
+
+        def run(src):
+            return [tools.query_parquet_files(paths[src], "select distinct src from logs") for _ in range(50)]
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = dict(zip(paths, pool.map(run, paths)))
+        for src, outputs in results.items():
+            assert all(json.loads(output) == [{"src": src}] for output in outputs)
+
+
+class TestGetSchema:
+    def test_reads_flat_columns_from_the_footer(self, tmp_path):
+        path = write_parquet(
+            tmp_path / "flat.parquet",
+            id=[1],
+            ts=pa.array([0], pa.timestamp("us")),
+            msg=["x"],
+        )
+        assert json.loads(tools.get_schema(path)) == {
+            "flat.parquet": [
+                {"column_name": "id", "column_type": "BIGINT"},
+                {"column_name": "ts", "column_type": "TIMESTAMP"},
+                {"column_name": "msg", "column_type": "VARCHAR"},
+            ]
+        }
+
+    def test_nested_columns_are_reported_whole(self, tmp_path):
+        path = write_parquet(
+            tmp_path / "nested.parquet",
+            id=[1],
+            attrs=[{"k": 1, "v": "x"}],
+            tags=[[1, 2]],
+            msg=["x"],
+        )
+        assert json.loads(tools.get_schema(path)) == {
+            "nested.parquet": [
+                {"column_name": "id", "column_type": "BIGINT"},
+                {"column_name": "attrs", "column_type": "STRUCT(k BIGINT, v VARCHAR)"},
+                {"column_name": "tags", "column_type": "BIGINT[]"},
+                {"column_name": "msg", "column_type": "VARCHAR"},
+            ]
+        }
+
+    def test_missing_file(self, tmp_path):
+        assert tools.get_schema(str(tmp_path / "nope.parquet")).startswith("Error getting schema: Parquet file not found")
+
+
+class TestSummarizeColumn:
+    @pytest.fixture
+    def logs(self, tmp_path):
+        return write_parquet(
+            tmp_path / "logs.parquet",
+            service=["cart", "cart", "auth", "cart", "auth", "db"],
+            level=["ERROR", "INFO", "ERROR", "ERROR", "INFO", "ERROR"],
+        )
+
+    def test_counts_values_most_frequent_first(self, logs):
+        assert json.loads(tools.summarize_column(logs, "service")) == [
+            {"service": "cart", "count": 3},
+            {"service": "auth", "count": 2},
+            {"service": "db", "count": 1},
+        ]
+
+    def test_where_and_limit(self, logs):
+        result = tools.summarize_column(logs, "service", where="level = 'ERROR'", limit=2)
+        assert json.loads(result) == [{"service": "cart", "count": 2}, {"service": "auth", "count": 1}]
+
+    def test_where_without_matches(self, logs):
+        result = tools.summarize_column(logs, "service", where="level = 'DEBUG'")
+        assert result == "Query executed successfully but returned no results."
+
+    def test_invalid_where(self, logs):
+        assert tools.summarize_column(logs, "service", where="no_such_column = 1").startswith("Error summarizing column:")
+
+    def test_column_names_are_quoted(self, tmp_path):
+        path = write_parquet(tmp_path / "odd.parquet", **{'my "col"': ["a", "a", "b"]})
+        assert json.loads(tools.summarize_column(path, 'my "col"')) == [
+            {'my "col"': "a", "count": 2},
+            {'my "col"': "b", "count": 1},
+        ]
+
+    @pytest.mark.parametrize("column", ["count", "Count"])
+    def test_column_named_count(self, tmp_path, column):
+        path = write_parquet(tmp_path / "counts.parquet", **{column: [4, 4, 3]})
+        assert json.loads(tools.summarize_column(path, column)) == [
+            {column: 4, "row_count": 2},
+            {column: 3, "row_count": 1},
+        ]